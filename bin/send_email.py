@@ -1,9 +1,42 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
+import argparse
+import os
 import sys
-import synapseclient
 
-from typing import List, NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, NamedTuple
+
+# synapseclient is slow to import, so it is only loaded once e-mails are
+# actually being sent rather than for ``--help`` or argument errors
+if TYPE_CHECKING:
+    import synapseclient
+
+
+# Submission annotations that are not scores, and so are left out of the e-mail
+NON_SCORE_ANNOTATIONS = frozenset(
+    {
+        "score_errors",
+        "score_status",
+        "validation_errors",
+        "validation_status",
+    }
+)
+
+# Number of Synapse REST calls to run at once. This matches the default
+# connection pool size of ``requests``, so no thread waits on a free connection
+MAX_WORKERS = 10
+
+# E-mail subject lines, filled in with ``str.format``
+SUCCESS_SUBJECT = "Evaluation Success: {submission_id}"
+FAILURE_SUBJECT = "Evaluation Failed: {submission_id}"
+SUMMARY_SUBJECT = "Evaluation Results: {summary}"
+# Short per-submission label used in the summary subject line
+SUMMARY_ITEM = "{submission_id} ({outcome})"
+# Divider placed between the bodies of a combined e-mail
+SUMMARY_SEPARATOR = "\n\n" + "-" * 40 + "\n\n"
 
 
 class SubmissionAnnotations(NamedTuple):
@@ -12,22 +45,51 @@ class SubmissionAnnotations(NamedTuple):
     reason: str
 
 
-def get_participant_id(syn: synapseclient.Synapse, submission_id: str) -> List[str]:
+class Email(NamedTuple):
+    recipients: List[str]
+    subject: str
+    body: str
+    summary: str
+
+
+def get_args():
+    """Set up command-line interface and get arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--view-id",
+        type=str,
+        required=True,
+        help="The Synapse ID of the Submission View",
+    )
+    parser.add_argument(
+        "--submission-ids",
+        type=lambda ids: list(filter(None, ids.split(","))),
+        required=True,
+        help="Comma-separated IDs of the submissions to send e-mails for",
+    )
+    parser.add_argument(
+        "--email-with-score",
+        type=str,
+        choices=["yes", "no"],
+        required=True,
+        help='"yes" to include the scores in the e-mail, otherwise "no"',
+    )
+
+    return parser.parse_args()
+
+
+def get_participant_id(submission: dict) -> List[str]:
     """
     Retrieves the teamId of the participating team that made
     the submission. If the submitter is an individual rather than
     a team, the userId for the individual is retrieved.
 
     Arguments:
-      syn: A Synapse Python client instance
-      submission_id: The ID for an individual submission within an evaluation queue
+      submission: The Submission JSON, as returned by ``/evaluation/submission/{id}``
 
     Returns:
       Returns the synID of a team or individual participant
     """
-    # Retrieve a Submission object
-    submission = syn.getSubmission(submission_id, downloadFile=False)
-
     # Get the teamId or userId of submitter
     participant_id = submission.get("teamId") or submission.get("userId")
 
@@ -36,13 +98,17 @@ def get_participant_id(syn: synapseclient.Synapse, submission_id: str) -> List[s
     return [participant_id]
 
 
-def get_score_dict(score):
-    strings = [""]
-    for key in score.keys():
-        string = f"{key} : {score[key][0]}" + "\n"
-        strings.append(string)
+def get_score_dict(score: dict) -> str:
+    """
+    Formats the score annotations as one ``<name> : <value>`` line per score.
 
-    return strings
+    Arguments:
+      score: The score annotations of the submission
+
+    Returns:
+      A string listing every score on its own line
+    """
+    return "\n".join(f"{key} : {value[0]}" for key, value in score.items())
 
 
 def email_template(
@@ -69,40 +135,34 @@ def email_template(
       A string for that represents the body of the e-mail to be sent out to submitting team or individual.
 
     """
-    templates = {
-        (
-            "VALIDATED",
-            "yes",
-        ): f"Submission {submission_id} has been evaluated with the following scores:\n"
-        + "\n".join(get_score_dict(score))
-        + f"\nView all your scores here: https://www.synapse.org/#!Synapse:{view_id}/tables/",
-        (
-            "VALIDATED",
-            "no",
-        ): f"Submission {submission_id} has been evaluated. Your score will be available after Challenge submissions are closed. Thank you for participating!",
-        (
-            "INVALID",
-            "yes",
-        ): f"Evaluation failed for Submission {submission_id}."
-        + "\n"
-        + f"Reason: '{reason}'."
-        + "\n"
-        + f"View your submissions here: https://www.synapse.org/#!Synapse:{view_id}/tables/, and contact the organizers for more information.",
-        (
-            "INVALID",
-            "no",
-        ): f"Evaluation failed for Submission {submission_id}."
-        + "\n"
-        + f"Reason: '{reason}'."
-        + "\n"
-        + "Please contact the organizers for more information.",
-    }
-
-    body = templates.get((status, email_with_score))
-
-    # If there is a typo in ``email_with_score``, ``body`` will be None;
-    # Raise an error if so, to avoid sending empty e-mails...
-    if body is None:
+    # Only build the body for the requested template
+    if (status, email_with_score) == ("VALIDATED", "yes"):
+        body = (
+            f"Submission {submission_id} has been evaluated with the following scores:\n"
+            + f"{get_score_dict(score)}\n"
+            + f"\nView all your scores here: https://www.synapse.org/#!Synapse:{view_id}/tables/"
+        )
+    elif (status, email_with_score) == ("VALIDATED", "no"):
+        body = f"Submission {submission_id} has been evaluated. Your score will be available after Challenge submissions are closed. Thank you for participating!"
+    elif (status, email_with_score) == ("INVALID", "yes"):
+        body = (
+            f"Evaluation failed for Submission {submission_id}."
+            + "\n"
+            + f"Reason: '{reason}'."
+            + "\n"
+            + f"View your submissions here: https://www.synapse.org/#!Synapse:{view_id}/tables/, and contact the organizers for more information."
+        )
+    elif (status, email_with_score) == ("INVALID", "no"):
+        body = (
+            f"Evaluation failed for Submission {submission_id}."
+            + "\n"
+            + f"Reason: '{reason}'."
+            + "\n"
+            + "Please contact the organizers for more information."
+        )
+    else:
+        # If there is a typo in ``email_with_score``, no template matches;
+        # Raise an error if so, to avoid sending empty e-mails...
         raise ValueError(
             f"Incorrect status and/or email_with_score arguments. Got status: {status}, email_with_score: {email_with_score}."
         )
@@ -128,48 +188,50 @@ def get_annotations(syn: synapseclient.Synapse, submission_id: str) -> NamedTupl
     submission_status = submission_annotations.get("validation_status")[0]
     error_reason = submission_annotations.get("validation_errors")[0]
 
-    # TODO: A more elegant way to only get the score annotations?
-    non_score_annotations = [
-        "score_errors",
-        "score_status",
-        "validation_errors",
-        "validation_status",
-    ]
+    # Keep the annotation order, so scores are listed in the e-mail
+    # in the order the scoring script wrote them
     submission_scores = {
-        key: submission_annotations.get(key)
-        for key in submission_annotations.keys()
-        if key not in non_score_annotations
+        key: value
+        for key, value in submission_annotations.items()
+        if key not in NON_SCORE_ANNOTATIONS
     }
     return SubmissionAnnotations(
         status=submission_status, score=submission_scores, reason=error_reason
     )
 
 
-def send_email(view_id: str, submission_id: str, email_with_score: str):
+def get_email(
+    view_id: str,
+    submission_id: str,
+    email_with_score: str,
+    submission_annotations: SubmissionAnnotations,
+    submission: dict,
+) -> Email:
     """
-    Sends an e-mail on the status of the individual submission
-    to the submitting team or individual.
+    Builds the e-mail on the status of the individual submission
+    to be sent to the submitting team or individual.
 
     Arguments:
       view_id: The view Id of the Submission View on Synapse
       submission_id: The ID for an individual submission within an evaluation queue
+      email_with_score: "no" if e-mail should not include score value / link to submissions views. Otherwise "yes".
+      submission_annotations: The annotations of the submission, as returned by ``get_annotations``
+      submission: The Submission JSON, as returned by ``/evaluation/submission/{id}``
 
-    """
-    # Initiate connection to Synapse
-    syn = synapseclient.login()
-
-    # Get MODEL_TO_DATA annotations for the given submission
-    submission_annotations = get_annotations(syn, submission_id)
+    Returns:
+      The recipients, subject, body and summary label of the e-mail
 
+    """
     # Get the Synapse users to send an e-mail to
-    ids_to_notify = get_participant_id(syn, submission_id)
+    ids_to_notify = get_participant_id(submission)
 
     # Create the subject and body of the e-mail message, depending on submission status
-    subject = (
-        f"Evaluation Success: {submission_id}"
-        if submission_annotations.status == "VALIDATED"
-        else f"Evaluation Failed: {submission_id}"
-    )
+    if submission_annotations.status == "VALIDATED":
+        subject = SUCCESS_SUBJECT.format(submission_id=submission_id)
+        outcome = "Success"
+    else:
+        subject = FAILURE_SUBJECT.format(submission_id=submission_id)
+        outcome = "Failed"
     body = email_template(
         submission_annotations.status,
         email_with_score,
@@ -179,13 +241,144 @@ def send_email(view_id: str, submission_id: str, email_with_score: str):
         submission_annotations.reason,
     )
 
+    summary = SUMMARY_ITEM.format(submission_id=submission_id, outcome=outcome)
+
+    return Email(recipients=ids_to_notify, subject=subject, body=body, summary=summary)
+
+
+def combine_emails(emails: List[Email]) -> Email:
+    """
+    Combines the e-mails for all submissions made by one team or individual
+    into a single message, so that they are notified only once per batch.
+
+    Arguments:
+      emails: The e-mails built for each submission of the participant
+
+    Returns:
+      The combined e-mail, whose subject lists each submission and its outcome
+    """
+    if len(emails) == 1:
+        return emails[0]
+
+    summary = ", ".join(email.summary for email in emails)
+    return Email(
+        recipients=emails[0].recipients,
+        subject=SUMMARY_SUBJECT.format(summary=summary),
+        body=SUMMARY_SEPARATOR.join(email.body for email in emails),
+        summary=summary,
+    )
+
+
+def send_emails(
+    view_id: str, submission_ids: List[str], email_with_score: str
+) -> List[str]:
+    """
+    Sends an e-mail on the status of each submission to the submitting
+    team or individual, reusing a single Synapse session for the whole batch.
+
+    Arguments:
+      view_id: The view Id of the Submission View on Synapse
+      submission_ids: The IDs of the submissions to send e-mails for
+      email_with_score: "no" if e-mail should not include score value / link to submissions views. Otherwise "yes".
+
+    Returns:
+      The IDs of the submissions whose e-mail could not be built or sent
+
+    """
+    # Fail before making any REST calls, rather than once the first e-mail is built
+    if email_with_score not in ("yes", "no"):
+        raise ValueError(
+            f"Invalid value for ``email_with_score``. Can either be 'yes' or 'no'. Got: {email_with_score}."
+        )
+
+    # Drop repeated submission IDs, keeping their order,
+    # so that no submission is reported twice
+    submission_ids = list(dict.fromkeys(submission_ids))
+
+    import synapseclient
+
+    # Initiate connection to Synapse, skipping the client version check.
+    # Logging in with ``silent`` also skips the user profile lookup
+    # made for the welcome message
+    syn = synapseclient.Synapse(skip_checks=True)
+    auth_token = os.environ.get("SYNAPSE_AUTH_TOKEN")
+    if auth_token:
+        # Use the token provided as a Nextflow secret directly,
+        # skipping the config file/cache lookups
+        syn.login(authToken=auth_token, silent=True)
+    else:
+        # Outside of Nextflow, fall back to ``~/.synapseConfig`` or the cached credentials
+        syn.login(silent=True)
+
+    failed_submission_ids = []
+    emails_by_participant = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # The annotations and the Submission are independent of each other and
+        # of other submissions, so queue every fetch in the batch up front
+        # rather than waiting on one REST call after the other.
+        # Only the Submission's IDs are needed, so skip building a ``Submission`` object
+        futures = {
+            submission_id: (
+                executor.submit(get_annotations, syn, submission_id),
+                executor.submit(
+                    syn.restGET, f"/evaluation/submission/{submission_id}"
+                ),
+            )
+            for submission_id in submission_ids
+        }
+
+    # Gather the e-mails for each participant, so that a team with several
+    # submissions in the batch receives a single summary e-mail.
+    # A failure on one submission is logged and skipped,
+    # so that it does not stop the e-mails for the rest of the batch
+    for submission_id, (annotations_future, submission_future) in futures.items():
+        try:
+            email = get_email(
+                view_id,
+                submission_id,
+                email_with_score,
+                annotations_future.result(),
+                submission_future.result(),
+            )
+        except Exception as e:
+            print(
+                f"An error occurred while building the e-mail for submission {submission_id}: {e}"
+            )
+            failed_submission_ids.append(submission_id)
+            continue
+        for participant_id in email.recipients:
+            emails_by_participant.setdefault(participant_id, []).append(
+                (submission_id, email)
+            )
+
     # Sends an e-mail notifying participant(s) that the evaluation succeeded or failed
-    syn.sendMessage(userIds=ids_to_notify, messageSubject=subject, messageBody=body)
+    for participant_id, entries in emails_by_participant.items():
+        email = combine_emails([email for _, email in entries])
+        try:
+            syn.sendMessage(
+                userIds=[participant_id],
+                messageSubject=email.subject,
+                messageBody=email.body,
+            )
+        except Exception as e:
+            print(
+                f"An error occurred while sending the e-mail '{email.subject}': {e}"
+            )
+            failed_submission_ids.extend(submission_id for submission_id, _ in entries)
+
+    return failed_submission_ids
 
 
 if __name__ == "__main__":
-    view_id = sys.argv[1]
-    submission_id = sys.argv[2]
-    email_with_score = sys.argv[3]
+    args = get_args()
+
+    failed_submission_ids = send_emails(
+        args.view_id, args.submission_ids, args.email_with_score
+    )
 
-    send_email(view_id, submission_id, email_with_score)
+    # Fail the SEND_EMAIL task if any e-mail could not be sent,
+    # after the e-mails that could be built have gone out
+    if failed_submission_ids:
+        sys.exit(
+            f"Failed to send e-mails for: {', '.join(failed_submission_ids)}"
+        )
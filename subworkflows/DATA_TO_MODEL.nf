@@ -42,5 +42,5 @@ workflow DATA_TO_MODEL {
     SCORE(VALIDATE.output, SYNAPSE_STAGE.output, UPDATE_SUBMISSION_STATUS_AFTER_VALIDATE.output, ANNOTATE_SUBMISSION_AFTER_VALIDATE.output, params.scoring_script)
     UPDATE_SUBMISSION_STATUS_AFTER_SCORE(SCORE.output.map { tuple(it[0], it[2]) })
     ANNOTATE_SUBMISSION_AFTER_SCORE(SCORE.output)
-    SEND_EMAIL(params.view_id, image_ch.map { it[0] }, params.email_with_score, ANNOTATE_SUBMISSION_AFTER_SCORE.output)
+    SEND_EMAIL(params.view_id, image_ch.map { it[0] }.collect(), params.email_with_score, ANNOTATE_SUBMISSION_AFTER_SCORE.output.collect())
 }